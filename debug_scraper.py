@@ -4,27 +4,21 @@ Debug version to see what StreetEasy returns
 """
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import html
 import random
 
-STREETEASY_URL = "https://streeteasy.com/for-rent/nyc/price:-4700%7Carea:102,119,136,141%7Cbeds%3E=2"
+from http_headers import ACCEPT_ENCODING, USER_AGENTS, response_encoding
+from parsing import MAX_LISTINGS, find_listing_cards, match_listing_fields
 
-def get_user_agent():
-    """Return a realistic user agent"""
-    agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
-    ]
-    return random.choice(agents)
+STREETEASY_URL = "https://streeteasy.com/for-rent/nyc/price:-4700%7Carea:102,119,136,141%7Cbeds%3E=2"
 
 def debug_scrape():
     """Debug what we're getting from StreetEasy"""
     headers = {
-        'User-Agent': get_user_agent(),
+        'User-Agent': random.choice(USER_AGENTS),
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
         'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate',
+        'Accept-Encoding': ACCEPT_ENCODING,
         'Connection': 'keep-alive',
         'Upgrade-Insecure-Requests': '1',
     }
@@ -33,7 +27,8 @@ def debug_scrape():
     print(f"📱 User-Agent: {headers['User-Agent']}")
     
     try:
-        response = requests.get(STREETEASY_URL, headers=headers, timeout=30)
+        session = requests.Session()
+        response = session.get(STREETEASY_URL, headers=headers, timeout=30)
         print(f"📊 Status Code: {response.status_code}")
         print(f"📏 Content Length: {len(response.content)} bytes")
         
@@ -43,14 +38,16 @@ def debug_scrape():
             print(response.text[:500])
             return
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Parse the whole document for the page-level diagnostics below
+        parser = html.HTMLParser(encoding=response_encoding(response))
+        tree = html.document_fromstring(response.content, parser=parser)
         
         # Check if we're getting a real page or a block/redirect
-        title = soup.find('title')
-        print(f"📰 Page Title: {title.get_text() if title else 'No title found'}")
+        title = tree.find('.//title')
+        print(f"📰 Page Title: {title.text_content() if title is not None else 'No title found'}")
         
         # Look for any obvious blocking messages
-        body_text = soup.get_text().lower()
+        body_text = tree.text_content().lower()
         blocking_keywords = ['blocked', 'robot', 'captcha', 'verification', 'access denied', 'forbidden']
         for keyword in blocking_keywords:
             if keyword in body_text:
@@ -63,99 +60,84 @@ def debug_scrape():
         
         # Try to find listing elements with various selectors
         potential_selectors = [
-            '[data-testid="listing-card"]',
-            '[class*="ListingCard-module__cardContainer"]',
-            'article',
-            '[class*="listing"]',
-            '[class*="card"]',
-            '[class*="item"]',
-            '[data-gtm*="listing"]',
-            'a[href*="/building/"]',
-            '[class*="search-result"]'
+            '//*[@data-testid="listing-card"]',
+            '//*[contains(@class, "ListingCard-module__cardContainer")]',
+            '//article',
+            '//*[contains(@class, "listing")]',
+            '//*[contains(@class, "card")]',
+            '//*[contains(@class, "item")]',
+            '//*[contains(@data-gtm, "listing")]',
+            '//a[contains(@href, "/building/")]',
+            '//*[contains(@class, "search-result")]'
         ]
         
         print("\n🔍 Searching for listing elements:")
         for selector in potential_selectors:
-            elements = soup.select(selector)
+            elements = tree.xpath(selector)
             print(f"  {selector}: {len(elements)} elements")
-            if elements and len(elements) > 0:
+            if elements:
                 # Show some attributes of the first element
-                first_elem = elements[0]
-                classes = first_elem.get('class', [])
+                classes = elements[0].get('class', '').split()
                 print(f"    First element classes: {classes}")
         
-        # Test the actual parsing logic
+        # Test the actual parsing logic: the monitor's own streaming card detection
         print("\n🏠 Testing actual listing extraction:")
-        listing_elements = soup.find_all('div', {'data-testid': 'listing-card'})
-        
-        if not listing_elements:
-            listing_elements = soup.find_all('div', class_=lambda x: x and 'ListingCard-module__cardContainer' in str(x))
+        organic_elements = find_listing_cards(response.content, response_encoding(response))
+        print(f"Found {len(organic_elements)} organic listing card elements "
+              f"among the first {MAX_LISTINGS} cards")
         
-        print(f"Found {len(listing_elements)} listing card elements")
-        
-        if listing_elements:
+        if organic_elements:
             print("\n📋 Testing first listing extraction:")
-            element = listing_elements[0]
+            fields = match_listing_fields(organic_elements[0])
             
             # Test address link extraction
-            address_link = element.find('a', class_=lambda x: x and 'ListingDescription-module__addressTextAction' in str(x))
-            if address_link:
+            address_link = fields.get('address')
+            if address_link is not None:
                 print(f"  ✅ Address link: {address_link.get('href')}")
-                print(f"  ✅ Address text: {address_link.get_text().strip()}")
+                print(f"  ✅ Address text: {address_link.text_content().strip()}")
+            elif fields.get('building_link') is not None:
+                print(f"  ❌ No address link found (fallback building link: {fields['building_link'].get('href')})")
             else:
                 print("  ❌ No address link found")
             
             # Test price extraction
-            price_elem = element.find('span', class_=lambda x: x and 'PriceInfo-module__price' in str(x))
-            if price_elem:
-                print(f"  ✅ Price: {price_elem.get_text().strip()}")
+            price_elem = fields.get('price')
+            if price_elem is not None:
+                print(f"  ✅ Price: {price_elem.text_content().strip()}")
             else:
                 print("  ❌ No price found")
             
             # Test title extraction
-            title_elem = element.find('p', class_=lambda x: x and 'ListingDescription-module__title' in str(x))
-            if title_elem:
-                print(f"  ✅ Title: {title_elem.get_text().strip()}")
+            title_elem = fields.get('title')
+            if title_elem is not None:
+                print(f"  ✅ Title: {title_elem.text_content().strip()}")
             else:
                 print("  ❌ No title found")
             
             # Test bed/bath extraction
-            bed_bath_items = element.find_all('span', class_=lambda x: x and 'BedsBathsSqft-module__text' in str(x))
-            if bed_bath_items:
-                bed_bath_texts = [item.get_text().strip() for item in bed_bath_items]
+            if fields['beds_baths']:
+                bed_bath_texts = [item.text_content().strip() for item in fields['beds_baths']]
                 print(f"  ✅ Bed/Bath info: {bed_bath_texts}")
             else:
                 print("  ❌ No bed/bath info found")
         
-        if rental_links:
-            print("📋 First few rental links:")
-            for i, link in enumerate(rental_links[:5]):
-                href = link.get('href')
-                text = link.get_text().strip()[:50]
-                print(f"  {i+1}. {href} - {text}")
-        
         # Look for building links specifically
-        building_links = soup.find_all('a', href=lambda x: x and '/building/' in x)
+        building_links = tree.xpath('//a[contains(@href, "/building/")]')
         print(f"\n🏠 Found {len(building_links)} links with '/building/' in href")
         
         if building_links:
             print("📋 First few building links:")
             for i, link in enumerate(building_links[:5]):
                 href = link.get('href')
-                text = link.get_text().strip()[:50]
-                print(f"  {i+1}. {href} - {text}")
-        
-        if rental_links:
-            print("📋 First few rental links:")
-            for i, link in enumerate(rental_links[:5]):
-                href = link.get('href')
-                text = link.get_text().strip()[:50]
+                text = link.text_content().strip()[:50]
                 print(f"  {i+1}. {href} - {text}")
         
         # Check for pagination or "no results" messages
-        no_results = soup.find(string=lambda x: x and 'no' in x.lower() and ('result' in x.lower() or 'listing' in x.lower()))
-        if no_results:
-            print(f"🔍 Possible 'no results' message: {no_results.strip()}")
+        for text in tree.itertext():
+            lowered = text.lower()
+            if 'no' in lowered and ('result' in lowered or 'listing' in lowered):
+                print(f"🔍 Possible 'no results' message: {text.strip()}")
+                break
         
     except Exception as e:
         print(f"❌ Error: {e}")
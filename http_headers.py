@@ -0,0 +1,25 @@
+"""
+HTTP header values and helpers shared by the monitor and the debug script
+"""
+
+from urllib3.util import make_headers
+
+# Only advertise encodings urllib3 can decode (br/zstd need their optional packages)
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding']
+
+# Realistic user agents; one is picked per session since a UA changing mid-connection looks like a bot
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+)
+
+def response_encoding(response):
+    """Charset from the Content-Type header, else UTF-8
+    
+    requests reports ISO-8859-1 for any text/* response without a charset,
+    which would garble StreetEasy's UTF-8 pages.
+    """
+    if 'charset' in response.headers.get('Content-Type', '').lower():
+        return response.encoding
+    return 'utf-8'
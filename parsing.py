@@ -0,0 +1,153 @@
+"""
+Listing extraction shared by the monitor and the debug script
+"""
+
+from lxml import etree, html
+
+STREETEASY_BASE_URL = "https://streeteasy.com"
+
+# (tag, class marker, field) for each listing card field
+LISTING_FIELDS = (
+    ('a', 'ListingDescription-module__addressTextAction', 'address'),
+    ('span', 'PriceInfo-module__price', 'price'),
+    ('p', 'ListingDescription-module__title', 'title'),
+    ('span', 'BedsBathsSqft-module__text', 'beds_baths'),
+)
+
+# Compiled once and run inside libxml2; the field union fetches every field of a card in one pass
+LISTING_FIELDS_XPATH = etree.XPath(' | '.join(
+    [f'.//{tag}[contains(@class, "{marker}")]' for tag, marker, _ in LISTING_FIELDS]
+    + ['.//a[contains(@href, "/building/")]']  # Fallback: any building link
+))
+# Featured and sponsored cards are skipped to avoid false positives
+PROMOTED_MATCH = etree.XPath(
+    'boolean(.//span[@data-testid="tag-text"][.="Featured"]'
+    ' | .//p[contains(@class, "ImageContainerFooter-module__sponsoredTag")])'
+)
+
+MAX_LISTINGS = 20  # Only look at the newest cards to avoid overload
+PARSE_CHUNK_SIZE = 64 * 1024
+
+def find_listing_cards(content, encoding=None):
+    """Stream the page through lxml and return the organic cards among the first MAX_LISTINGS
+    
+    Only completed card subtrees are kept: other divs are cleared as they close
+    and everything preceding a card is detached, so memory stays at roughly the
+    kept cards. Feeding stops once enough cards have been seen.
+    Featured/sponsored cards are dropped as soon as they close.
+    Pass the HTTP charset as encoding; without it libxml2 falls back to
+    Latin-1 on pages that have no <meta charset>.
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'), tag='div', encoding=encoding)
+    parser.set_element_class_lookup(html.HtmlElementClassLookup())
+    cards = []
+    card_count = 0
+    card_depth = 0  # How many (primary or fallback) listing cards the parser is currently inside
+    fallback_cards = []
+    
+    for offset in range(0, len(content), PARSE_CHUNK_SIZE):
+        parser.feed(content[offset:offset + PARSE_CHUNK_SIZE])
+        for event, element in parser.read_events():
+            is_card = element.get('data-testid') == 'listing-card'
+            is_fallback_card = 'ListingCard-module__cardContainer' in (element.get('class') or '')
+            if event == 'start':
+                card_depth += is_card or is_fallback_card
+                continue
+            card_depth -= is_card or is_fallback_card
+            
+            if is_card:
+                card_count += 1
+                if not PROMOTED_MATCH(element):
+                    cards.append(element)
+                # Detach everything parsed before this card, at every level up to the root
+                # (kept cards stay alive via the list)
+                node = element
+                while node is not None:
+                    while node.getprevious() is not None:
+                        del node.getparent()[0]
+                    node = node.getparent()
+                fallback_cards = []
+                if card_count >= MAX_LISTINGS:
+                    break
+            elif is_fallback_card:
+                # Fallback: look for ListingCard containers
+                if not card_count:
+                    fallback_cards.append(element)
+            elif not card_depth:
+                # Not part of a card; its contents are never needed
+                element.clear(keep_tail=True)
+        if card_count >= MAX_LISTINGS:
+            break
+    
+    if not card_count:
+        fallback_cards = fallback_cards[:MAX_LISTINGS]
+        card_count = len(fallback_cards)
+        cards = [card for card in fallback_cards if not PROMOTED_MATCH(card)]
+    
+    if card_count > len(cards):
+        print(f"Skipping {card_count - len(cards)} featured/sponsored listing(s)")
+    return cards
+
+def match_listing_fields(element):
+    """Return a card's raw field nodes from one XPath pass; missing fields are absent"""
+    # Bucket the single XPath result (document order) by field, keeping the first match
+    fields = {'beds_baths': []}
+    for node in LISTING_FIELDS_XPATH(element):
+        node_class = node.get('class') or ''
+        for tag, marker, field in LISTING_FIELDS:
+            if node.tag == tag and marker in node_class:
+                break
+        else:
+            field = 'building_link'
+        if field == 'beds_baths':
+            fields[field].append(node)
+        else:
+            fields.setdefault(field, node)
+    return fields
+
+def extract_listing(element):
+    """Extract a listing dict from a card, or None if it has no usable link"""
+    fields = match_listing_fields(element)
+    
+    # Extract listing URL from the address link
+    address_link = fields.get('address', fields.get('building_link'))
+    listing_url = address_link.get('href') if address_link is not None else None
+    if not listing_url:
+        return None
+    if listing_url.startswith('/'):
+        listing_url = STREETEASY_BASE_URL + listing_url
+    
+    # Extract listing ID from URL 
+    # Format: https://streeteasy.com/building/51-1-avenue-new_york/9
+    listing_id = listing_url.rpartition('/')[2] or listing_url
+    
+    price_elem = fields.get('price')
+    price_text = price_elem.text_content().strip() if price_elem is not None else "Price not found"
+    
+    # Extract address from the link text
+    address_text = address_link.text_content().strip()
+    
+    # Extract neighborhood/title
+    title_elem = fields.get('title')
+    title_text = title_elem.text_content().strip() if title_elem is not None else address_text
+    
+    # Combine title with bed/bath info
+    beds_baths_text = " • ".join(item.text_content().strip() for item in fields['beds_baths'])
+    full_title = f"{title_text} - {beds_baths_text}" if beds_baths_text else title_text
+    
+    return {
+        'id': listing_id,
+        'url': listing_url,
+        'title': full_title,
+        'price': price_text,
+        'address': address_text
+    }
+
+def parse_listings(content, encoding=None):
+    """Parse listing dicts from the organic cards in a StreetEasy search page"""
+    listings = []
+    for element in find_listing_cards(content, encoding):
+        listing = extract_listing(element)
+        if listing:
+            listings.append(listing)
+    return listings
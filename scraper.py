@@ -5,167 +5,266 @@ Checks for new listings every 5 minutes and sends email alerts
 """
 
 import requests
-from bs4 import BeautifulSoup
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+import orjson
+import tempfile
+import stat
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import ssl
+import contextlib
+from email.message import EmailMessage
 import time
 import random
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+from http_headers import USER_AGENTS, ACCEPT_ENCODING, response_encoding
+from parsing import parse_listings
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Configuration
 STREETEASY_URL = "https://streeteasy.com/for-rent/nyc/price:-4700%7Carea:102,119,136,141%7Cbeds%3E=2?sort_by=listed_desc"
+# Whitespace-separated saved searches to monitor (StreetEasy URLs contain commas)
+STREETEASY_URLS = os.getenv('STREETEASY_URLS', '').split() or [STREETEASY_URL]
+MAX_CONCURRENT_SEARCHES = 3  # Keep parallel requests to StreetEasy polite
 SEEN_LISTINGS_FILE = "seen_listings.json"
+RESPONSE_CACHE_FILE = "response_cache.json"  # HTTP validators + listings from the last full fetch
+MAX_SEEN_LISTINGS = 10000  # Least recently seen IDs are forgotten past this
+CHECK_INTERVAL = os.getenv('CHECK_INTERVAL')  # Minutes between checks; unset runs a single check
+
+# Statuses StreetEasy's bot protection answers with; we back off and retry with a fresh session
+BLOCKED_STATUS_CODES = (403, 429, 503)
+MAX_BLOCKED_RETRIES = 2
+MAX_BACKOFF_SECONDS = 3600
 
 # Email configuration (set these as environment variables)
 EMAIL_FROM = os.getenv('EMAIL_FROM')  # Your Gmail address
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')  # Gmail app password
 EMAIL_TO = os.getenv('EMAIL_TO')  # Where to send alerts
 
+# Browser-like headers sent with every request
+BASE_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Ch-Ua': '"Google Chrome";v="119", "Chromium";v="119", "Not?A_Brand";v="24"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"macOS"',
+    'Cache-Control': 'max-age=0',
+}
+
+def create_session():
+    """Create a pooled, retrying session with a fixed user agent for its lifetime"""
+    session = requests.Session()
+    session.headers.update(BASE_HEADERS)
+    session.headers['User-Agent'] = random.choice(USER_AGENTS)
+    # Retry connection errors only; blocked statuses are left to fetch_with_backoff()
+    retries = Retry(total=3, backoff_factor=1, status=0, respect_retry_after_header=False)
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries))
+    return session
+
+# Shared across polls so the TCP/TLS connection and StreetEasy cookies are reused
+_SESSION = create_session()
+_SESSION_LOCK = threading.Lock()
+
+def write_file_atomic(path, data):
+    """Write bytes to a temp file and rename it over path so a crash never truncates it"""
+    # mkstemp creates 0600 files; keep the existing file's mode (or a normal 0644)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 def load_seen_listings():
-    """Load previously seen listing IDs from file"""
+    """Load previously seen listing IDs from file as an LRU, least recently seen first"""
     try:
-        with open(SEEN_LISTINGS_FILE, 'r') as f:
-            return set(json.load(f))
+        with open(SEEN_LISTINGS_FILE, 'rb') as f:
+            return OrderedDict.fromkeys(orjson.loads(f.read())[-MAX_SEEN_LISTINGS:])
     except FileNotFoundError:
-        return set()
+        return OrderedDict()
+
+def remember_listings(seen_listings, listing_ids):
+    """Mark listing IDs as most recently seen, evicting the stalest past MAX_SEEN_LISTINGS"""
+    for listing_id in listing_ids:
+        seen_listings[listing_id] = None
+        seen_listings.move_to_end(listing_id)
+    while len(seen_listings) > MAX_SEEN_LISTINGS:
+        seen_listings.popitem(last=False)
 
 def save_seen_listings(seen_listings):
     """Save seen listing IDs to file"""
-    with open(SEEN_LISTINGS_FILE, 'w') as f:
-        json.dump(list(seen_listings), f)
-
-def get_user_agent():
-    """Return a realistic user agent"""
-    agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0'
-    ]
-    return random.choice(agents)
-
-def scrape_listings():
-    """Scrape current listings from StreetEasy"""
-    headers = {
-        'User-Agent': get_user_agent(),
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Sec-Fetch-Dest': 'document',
-        'Sec-Fetch-Mode': 'navigate',
-        'Sec-Fetch-Site': 'none',
-        'Sec-Ch-Ua': '"Google Chrome";v="119", "Chromium";v="119", "Not?A_Brand";v="24"',
-        'Sec-Ch-Ua-Mobile': '?0',
-        'Sec-Ch-Ua-Platform': '"macOS"',
-        'Cache-Control': 'max-age=0',
+    write_file_atomic(SEEN_LISTINGS_FILE, orjson.dumps(list(seen_listings)))
+
+def load_response_cache():
+    """Load cached validators and listings, keyed by search URL"""
+    try:
+        with open(RESPONSE_CACHE_FILE, 'rb') as f:
+            cache = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+    # Anything but a URL -> entry mapping (e.g. a hand-edited file) is ignored
+    return cache if isinstance(cache, dict) else {}
+
+def save_response_cache(cache):
+    """Save cache entries for the searches still being monitored"""
+    # Entries for searches that were removed are useless
+    entries = {url: cache[url] for url in STREETEASY_URLS if isinstance(cache.get(url), dict)}
+    if not entries and not os.path.exists(RESPONSE_CACHE_FILE):
+        return
+    write_file_atomic(RESPONSE_CACHE_FILE, orjson.dumps(entries))
+
+def cache_response(cache, url, response, listings):
+    """Remember the response's ETag/Last-Modified with its parsed listings"""
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not etag and not last_modified:
+        cache.pop(url, None)
+        return
+    cache[url] = {
+        'etag': etag,
+        'last_modified': last_modified,
+        'listings': listings
     }
-    
+
+def fetch_with_backoff(url, headers):
+    """GET url, backing off exponentially and rotating the session while we look blocked"""
+    global _SESSION
+    for attempt in range(MAX_BLOCKED_RETRIES + 1):
+        session = _SESSION
+        response = session.get(url, headers=headers, timeout=30)
+        if response.status_code not in BLOCKED_STATUS_CODES or attempt == MAX_BLOCKED_RETRIES:
+            return response
+        
+        delay = min(MAX_BACKOFF_SECONDS, 60 * 2 ** attempt)
+        delay += random.random() * delay * 0.1
+        print(f"⚠️  Got HTTP {response.status_code}, retrying in {delay:.0f}s with a new session")
+        time.sleep(delay)
+        # Other searches may share the blocked session; only the first one to notice replaces it
+        with _SESSION_LOCK:
+            if _SESSION is session:
+                _SESSION = create_session()
+
+def scrape_listings(url, cache):
+    """Scrape current listings for one StreetEasy search, updating its cache entry"""
     try:
-        print(f"[{datetime.now()}] Checking StreetEasy for new listings...")
+        print(f"[{datetime.now()}] Checking StreetEasy for new listings: {url}")
         
-        # Add a small delay to seem more human
-        time.sleep(random.uniform(1, 3))
+        # Send cache validators so an unchanged page comes back as an empty 304
+        headers = {}
+        cached = cache.get(url)
+        if not isinstance(cached, dict) or not isinstance(cached.get('listings'), list):
+            # Validators are useless without the listings a 304 would reuse
+            cached = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
         
-        # Use a session for better cookie handling
-        session = requests.Session()
-        response = session.get(STREETEASY_URL, headers=headers, timeout=30)
+        response = fetch_with_backoff(url, headers)
+        if response.status_code == 304:
+            print(f"Page unchanged since last check, reusing {len(cached['listings'])} cached listings")
+            return cached['listings']
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find listing containers using StreetEasy's current class names
-        listings = []
-        
-        # Look for the specific StreetEasy listing cards
-        listing_elements = soup.find_all('div', {'data-testid': 'listing-card'})
-        
-        if not listing_elements:
-            # Fallback: look for ListingCard containers
-            listing_elements = soup.find_all('div', class_=lambda x: x and 'ListingCard-module__cardContainer' in str(x))
-        
-        print(f"Found {len(listing_elements)} listing card elements")
-        
-        for element in listing_elements[:20]:  # Limit to first 20 to avoid overload
-            try:
-                # Skip featured and sponsored listings to avoid false positives
-                featured_tag = element.find('span', {'data-testid': 'tag-text'}, string='Featured')
-                sponsored_tag = element.find('p', class_=lambda x: x and 'ImageContainerFooter-module__sponsoredTag' in str(x))
-                
-                if featured_tag:
-                    print(f"Skipping featured listing")
-                    continue
-                    
-                if sponsored_tag:
-                    print(f"Skipping sponsored listing")
-                    continue
-                
-                # Extract listing URL from the address link
-                address_link = element.find('a', class_=lambda x: x and 'ListingDescription-module__addressTextAction' in str(x))
-                if not address_link:
-                    # Fallback: look for any building link
-                    address_link = element.find('a', href=lambda x: x and '/building/' in str(x))
-                
-                if not address_link:
-                    continue
-                    
-                listing_url = address_link.get('href')
-                if not listing_url.startswith('http'):
-                    listing_url = 'https://streeteasy.com' + listing_url
-                
-                # Extract listing ID from URL 
-                # Format: https://streeteasy.com/building/51-1-avenue-new_york/9
-                url_parts = listing_url.split('/')
-                listing_id = url_parts[-1] if url_parts else listing_url
-                
-                # Extract price
-                price_elem = element.find('span', class_=lambda x: x and 'PriceInfo-module__price' in str(x))
-                price_text = price_elem.get_text().strip() if price_elem else "Price not found"
-                
-                # Extract address from the link text
-                address_text = address_link.get_text().strip() if address_link else "Address not found"
-                
-                # Extract neighborhood/title
-                title_elem = element.find('p', class_=lambda x: x and 'ListingDescription-module__title' in str(x))
-                title_text = title_elem.get_text().strip() if title_elem else address_text
-                
-                # Extract bed/bath info
-                beds_baths = []
-                bed_bath_items = element.find_all('span', class_=lambda x: x and 'BedsBathsSqft-module__text' in str(x))
-                for item in bed_bath_items:
-                    beds_baths.append(item.get_text().strip())
-                
-                beds_baths_text = " • ".join(beds_baths) if beds_baths else ""
-                
-                # Combine title with bed/bath info
-                full_title = f"{title_text} - {beds_baths_text}" if beds_baths_text else title_text
-                
-                listings.append({
-                    'id': listing_id,
-                    'url': listing_url,
-                    'title': full_title,
-                    'price': price_text,
-                    'address': address_text
-                })
-                
-            except Exception as e:
-                print(f"Error parsing listing element: {e}")
-                continue
-        
+        listings = parse_listings(response.content, response_encoding(response))
         print(f"Found {len(listings)} listings")
+        cache_response(cache, url, response, listings)
         return listings
         
     except requests.RequestException as e:
         print(f"Error fetching listings: {e}")
         return []
 
+def scrape_all_searches():
+    """Scrape every search in STREETEASY_URLS concurrently over the shared session"""
+    cache = load_response_cache()
+    
+    def scrape_staggered(url):
+        # Spread the burst out a little when several searches start together
+        if len(STREETEASY_URLS) > 1:
+            time.sleep(random.uniform(0, 2))
+        return scrape_listings(url, cache)
+    
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEARCHES) as executor:
+        results = list(executor.map(scrape_staggered, STREETEASY_URLS))
+    
+    save_response_cache(cache)
+    return [listing for listings in results for listing in listings]
+
+class Mailer:
+    """Gmail SMTP connection that is opened on first use and kept for later alerts"""
+    
+    def __init__(self, username, password, host='smtp.gmail.com', port=465):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.server = None
+    
+    def connect(self):
+        """Open an implicit-TLS connection and log in (no STARTTLS round trip)"""
+        self.close()
+        server = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        try:
+            server.login(self.username, self.password)
+        except BaseException:
+            # Never keep a connection that isn't logged in; the next send retries from scratch
+            with contextlib.suppress(smtplib.SMTPException, OSError):
+                server.quit()
+            raise
+        self.server = server
+    
+    def send(self, msg, to_addrs):
+        """Send msg, reconnecting once if the server dropped the idle connection"""
+        if self.server is None:
+            self.connect()
+        try:
+            self.server.send_message(msg, to_addrs=to_addrs)
+        except (smtplib.SMTPServerDisconnected, ssl.SSLError, ConnectionError):
+            # Only a dropped connection is retried; other SMTP errors (refused recipients,
+            # timeouts after DATA) would just resend or duplicate the alert
+            self.connect()
+            self.server.send_message(msg, to_addrs=to_addrs)
+    
+    def keepalive(self):
+        """NOOP an open connection between polls; forget it if the server hung up"""
+        if self.server is None:
+            return
+        try:
+            self.server.noop()
+        except (smtplib.SMTPException, OSError):
+            self.close()
+    
+    def close(self):
+        """Quit the connection if one is open"""
+        if self.server is not None:
+            with contextlib.suppress(smtplib.SMTPException, OSError):
+                self.server.quit()
+            self.server = None
+
+_MAILER = Mailer(EMAIL_FROM, EMAIL_PASSWORD)
+
 def send_email(new_listings):
     """Send email notification for new listings"""
     if not EMAIL_FROM or not EMAIL_PASSWORD or not EMAIL_TO:
@@ -176,33 +275,27 @@ def send_email(new_listings):
     email_list = [email.strip() for email in EMAIL_TO.replace(';', ',').split(',')]
     
     try:
-        msg = MIMEMultipart()
+        msg = EmailMessage()
         msg['From'] = EMAIL_FROM
         msg['To'] = ', '.join(email_list)
         msg['Subject'] = f"🏠 {len(new_listings)} New StreetEasy Listing(s) Found!"
         
-        body = "New apartments matching your criteria:\n\n"
-        
-        for listing in new_listings:
-            body += f"📍 {listing['title']}\n"
-            body += f"💰 {listing['price']}\n"
-            body += f"📍 {listing['address']}\n"
-            body += f"🔗 {listing['url']}\n"
-            body += "-" * 50 + "\n\n"
-        
-        body += f"\nFound at: {datetime.now()}"
-        body += f"\nSearch URL: {STREETEASY_URL}"
-        
-        msg.attach(MIMEText(body, 'plain'))
+        body = ["New apartments matching your criteria:\n\n"]
+        body.extend(
+            f"📍 {listing['title']}\n"
+            f"💰 {listing['price']}\n"
+            f"📍 {listing['address']}\n"
+            f"🔗 {listing['url']}\n"
+            f"{'-' * 50}\n\n"
+            for listing in new_listings
+        )
+        body.append(f"\nFound at: {datetime.now()}")
+        body.extend(f"\nSearch URL: {url}" for url in STREETEASY_URLS)
         
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_FROM, EMAIL_PASSWORD)
+        msg.set_content("".join(body))
         
-        # Send to all recipients
-        server.send_message(msg, to_addrs=email_list)
-        server.quit()
+        # Send to all recipients over the shared Gmail connection
+        _MAILER.send(msg, email_list)
         
         print(f"✅ Email sent successfully to {len(email_list)} recipient(s): {', '.join(email_list)}")
         
@@ -212,29 +305,30 @@ def send_email(new_listings):
 def main():
     """Main function"""
     print("🏠 StreetEasy Monitor Starting...")
-    print(f"Monitoring: {STREETEASY_URL}")
+    for url in STREETEASY_URLS:
+        print(f"Monitoring: {url}")
     
     seen_listings = load_seen_listings()
     print(f"Previously seen listings: {len(seen_listings)}")
     
     # Scrape current listings
-    current_listings = scrape_listings()
+    current_listings = scrape_all_searches()
     
     if not current_listings:
         print("⚠️  No listings found. Check if the scraper needs updating.")
         return
     
-    # Find new listings
-    new_listings = []
-    current_ids = set()
+    # Drop exact repeats (e.g. the same listing found by two saved searches); IDs are unit
+    # numbers that different buildings can share, so only identical URLs count as repeats
+    current_listings = list({listing['url']: listing for listing in current_listings}.values())
     
-    for listing in current_listings:
-        current_ids.add(listing['id'])
-        if listing['id'] not in seen_listings:
-            new_listings.append(listing)
+    # Find new listings with a set difference, keeping page order (newest first)
+    current_ids = {listing['id'] for listing in current_listings}
+    new_ids = current_ids - seen_listings.keys()
+    new_listings = [listing for listing in current_listings if listing['id'] in new_ids]
     
     # Update seen listings
-    seen_listings.update(current_ids)
+    remember_listings(seen_listings, current_ids)
     save_seen_listings(seen_listings)
     
     # Send notifications for new listings
@@ -249,5 +343,18 @@ def main():
     
     print(f"✅ Check completed at {datetime.now()}")
 
+def run_forever(interval_minutes):
+    """Run a check every interval_minutes, jittered so polls don't land on a fixed beat"""
+    while True:
+        main()
+        time.sleep(max(0, interval_minutes * 60 + random.uniform(-30, 30)))
+        _MAILER.keepalive()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        if CHECK_INTERVAL:
+            run_forever(float(CHECK_INTERVAL))
+        else:
+            main()
+    finally:
+        _MAILER.close()
\ No newline at end of file